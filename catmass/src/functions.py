@@ -9,15 +9,296 @@ Created on Fri Jul  9 15:06:18 2021
 #   Packages and Modules   #
 ############################
 
+import math
+from functools import lru_cache
+from types import MappingProxyType
+
 import numpy as np
 import xraylib
 
+try:
+    # numpy-vectorized xraylib API, built alongside xraylib when numpy is present
+    import xraylib_np
+except ImportError:
+    xraylib_np = None
+
+try:
+    from numba import njit
+except ImportError:
+    # numba is optional, without it the kernels run as plain Python
+    def njit(*args, **kwargs):
+        if len(args) == 1 and callable(args[0]):
+            return args[0]
+        return lambda func: func
+
+
+##################
+#    CONSTANTS   #
+##################
+
+# xraylib shell index for each supported absorption edge
+EDGE_SHELLS = {'K': 0, 'L1': 1, 'L2': 2, 'L3': 3}
+
+# Largest atomic number covered by the lookup tables below
+Z_MAX = 120
+
+# Atomic weight [g/mol] indexed by atomic number, NaN where xraylib has no data
+_AW_LUT = np.full(Z_MAX+1, np.nan)
+for _z in range(1, Z_MAX+1):
+    try:
+        _AW_LUT[_z] = xraylib.AtomicWeight(_z)
+    except ValueError:
+        pass
+_AW_LUT[_AW_LUT == 0] = np.nan
+
+# Edge energy [keV] indexed by atomic number and EDGE_SHELLS value, NaN where
+# the element has no such edge
+_EDGE_LUT = np.full((Z_MAX+1, len(EDGE_SHELLS)), np.nan)
+for _z in range(1, Z_MAX+1):
+    for _shell in EDGE_SHELLS.values():
+        try:
+            _EDGE_LUT[_z, _shell] = xraylib.EdgeEnergy(_z, _shell)
+        except ValueError:
+            pass
+_EDGE_LUT[_EDGE_LUT == 0] = np.nan
+del _z, _shell
+
 
 ##################
 #    FUNCTIONS   #
 ##################
 
 
+# xraylib tables are constant, so repeated lookups are served from a cache
+
+@lru_cache(maxsize=128)
+def _z2sym(z):
+    return xraylib.AtomicNumberToSymbol(z)
+
+
+@lru_cache(maxsize=128)
+def _sym2z(symbol):
+    return xraylib.SymbolToAtomicNumber(symbol)
+
+
+def _edge_energy(z, shell):
+    '''
+    Returns the edge energy [keV] of shell for element z from _EDGE_LUT,
+    raising ValueError when the element has no such edge.
+    '''
+    E = _EDGE_LUT[z, shell] if 0 < z <= Z_MAX else math.nan
+    if math.isnan(E):
+        raise ValueError('No edge energy for Z = {0:d}, shell = {1:d}'.format(z, shell))
+    return float(E)
+
+
+def _cs_photo_pair(Z, E_low, E_high):
+    '''
+    Returns the photoionization cross sections [cm^2/g] of each element of Z
+    at E_low and E_high [keV] as an (n, 2) array, in a single xraylib_np call
+    when it is available.
+    '''
+    if xraylib_np is not None and E_low > 0:
+        Photo_XS = xraylib_np.CS_Photo(Z.astype(np.int_), np.array([E_low, E_high]))
+        if (Photo_XS > 0).all():
+            return Photo_XS
+
+    # xraylib_np returns 0 for unsupported inputs, xraylib raises the reason
+    Photo_XS = np.empty((len(Z),2))
+    for i, z in enumerate(Z.tolist()):
+        Photo_XS[i,0] = xraylib.CS_Photo(z, E_low)
+        Photo_XS[i,1] = xraylib.CS_Photo(z, E_high)
+    return Photo_XS
+
+
+@njit(cache=True, error_model='numpy')
+def _mass_step(mf, xs_lo, xs_hi, AL, Area):
+    '''
+    Calculates the sample mass and transmission edge step from the mass
+    fractions and photoionization cross sections below and above the edge.
+
+    Returns
+    -------
+    mass : FLOAT
+        Sample mass [g] giving a total absorption of AL above the edge.
+    step : FLOAT
+        Largest edge step of any element in the sample.
+    mu_hi : FLOAT
+        Mass weighted photoionization cross section [cm^2/g] above the edge.
+
+    '''
+    mu_hi = 0.0
+    for i in range(mf.shape[0]):
+        mu_hi += mf[i]*xs_hi[i]
+
+    mass = AL*Area/mu_hi
+
+    # Scalar maximum over the few elements, NaN propagates as with np.max
+    step = -np.inf
+    for i in range(mf.shape[0]):
+        s = mf[i]*mass/Area*(xs_hi[i]-xs_lo[i])
+        if np.isnan(s):
+            step = s
+            break
+        if s > step:
+            step = s
+
+    return mass, step, mu_hi
+
+
+@lru_cache(maxsize=256)
+def _parse(formula):
+    '''
+    Parses a chemical formula with xraylib.CompoundParser, caching the result
+    for repeated formulas. The arrays are shared between calls and therefore
+    read-only.
+
+    Returns
+    -------
+    Elements : INT32 ARRAY
+        Atomic number of each element, in increasing order.
+    massFractions : FLOAT64 ARRAY
+        Mass fraction of each element.
+    nElements : INT
+        Number of distinct elements.
+
+    '''
+    Compound = xraylib.CompoundParser(formula)
+    Elements = np.array(Compound['Elements'], dtype=np.int32)
+    massFractions = np.array(Compound['massFractions'], dtype=np.float64)
+    for arr in (Elements, massFractions):
+        arr.flags.writeable = False
+    return Elements, massFractions, Compound['nElements']
+
+
+@lru_cache(maxsize=128)
+def _parse_complex(Complex):
+    '''
+    Parses a metal complex and returns its atomic numbers, mass fractions and
+    a map from atomic number to position in those arrays. The arrays and map
+    are shared between calls and therefore read-only.
+    '''
+    Z, MF = _parse(Complex)[:2]
+    Complex_Index = MappingProxyType({z: i for i, z in enumerate(Z.tolist())})
+    return Z, MF, Complex_Index
+
+
+def _check_mol_min(mol_min):
+    '''
+    Raises ValueError if _compose_mass_fractions could not normalize the moles,
+    e.g. for a 0 or 100 % loading, or loadings adding up to more than 100 %.
+    '''
+    if not (mol_min > 0 and np.isfinite(mol_min)):
+        raise ValueError('Every component must have a positive mass fraction')
+
+
+def _check_atomic_weights(*Z_arrays):
+    '''
+    Raises ValueError if any element of the given atomic number arrays has no
+    atomic weight in _AW_LUT.
+    '''
+    for Z in Z_arrays:
+        if np.isnan(_AW_LUT[Z]).any():
+            raise ValueError('Z out of range')
+
+
+# Placeholder for an absent component in _compose_mass_fractions
+# Read-only like the _parse arrays, so numba compiles a single signature
+_NO_COMPONENT = (np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64))
+for _arr in _NO_COMPONENT:
+    _arr.flags.writeable = False
+del _arr
+
+
+@njit(cache=True, error_model='numpy')
+def _compose_mass_fractions(Z1, MF1, w1, Z2, MF2, w2, Z3, MF3, w3, aw_lut):
+    '''
+    Combines up to three components, each weighted by its mass fraction of the
+    sample, and converts them to moles normalized by the smallest one.
+
+    Parameters
+    ----------
+    Z1, Z2, Z3 : INT ARRAY
+        Atomic numbers of each component. Pass empty arrays for an absent
+        component.
+    MF1, MF2, MF3 : FLOAT ARRAY
+        Mass fractions of the elements within each component.
+    w1, w2, w3 : FLOAT
+        Mass fraction of each component in the sample.
+    aw_lut : FLOAT ARRAY
+        Atomic weights [g/mol] indexed by atomic number (_AW_LUT).
+
+    Returns
+    -------
+    Z : INT ARRAY
+        Atomic number of each element of the combined sample.
+    mol : FLOAT ARRAY
+        Normalized moles of each element of the combined sample.
+    mol_min : FLOAT
+        Smallest unnormalized mole value. Callers must reject a zero or
+        non-finite value, for which mol is not meaningful.
+
+    '''
+    n1 = Z1.shape[0]
+    n2 = Z2.shape[0]
+    n3 = Z3.shape[0]
+    n = n1 + n2 + n3
+
+    Z = np.empty(n, dtype=np.int32)
+    mol = np.empty(n, dtype=np.float64)
+    for i in range(n1):
+        Z[i] = Z1[i]
+        mol[i] = MF1[i]*w1
+    for i in range(n2):
+        Z[n1+i] = Z2[i]
+        mol[n1+i] = MF2[i]*w2
+    for i in range(n3):
+        Z[n1+n2+i] = Z3[i]
+        mol[n1+n2+i] = MF3[i]*w3
+
+    mol_min = np.inf
+    for i in range(n):
+        mol[i] = mol[i]/aw_lut[Z[i]]
+        if mol[i] < mol_min:
+            mol_min = mol[i]
+    for i in range(n):
+        mol[i] = mol[i]/mol_min
+
+    return Z, mol, mol_min
+
+
+def _merge_formula(Z, mol):
+    '''
+    Builds a condensed chemical formula from per-component atomic numbers and
+    moles, summing repeated elements and ordering them by atomic number.
+
+    Parameters
+    ----------
+    Z : ARRAY
+        Atomic number of each component.
+    mol : ARRAY
+        Normalized moles of each component.
+
+    Returns
+    -------
+    Sample_String : STR
+        Condensed chemical formula, e.g. 'O3.000000Al2.000000'.
+
+    '''
+    merged = {}
+    for z, m in zip(Z.tolist(), mol.tolist()):
+        merged[z] = merged.get(z, 0.0) + m
+
+    parts = []
+    for z, m in sorted(merged.items()):
+        parts.append(_z2sym(z))
+        parts.append(format(m, '.6f'))
+    Sample_String = ''.join(parts)
+
+    return Sample_String
+
+
+
 def XASMassCalc(Sample, Element, Edge, Area, AL, gamma = 50 ,delta = 50):
     '''
     
@@ -148,58 +429,34 @@ def XASMassCalc(Sample, Element, Edge, Area, AL, gamma = 50 ,delta = 50):
         area = float(Area)
         
         #Extract Chemcial Information from Sample
-        Elements = xraylib.CompoundParser(Sample)
+        Elements, massFractions, nElements = _parse(Sample)
 
         #Identify Edge Energy
-        if Edge == 'K':
-            E0 = xraylib.EdgeEnergy(xraylib.SymbolToAtomicNumber(Element),0)
-        elif Edge == 'L1':
-            E0 = xraylib.EdgeEnergy(xraylib.SymbolToAtomicNumber(Element),1)
-        elif Edge == 'L2':
-            E0 = xraylib.EdgeEnergy(xraylib.SymbolToAtomicNumber(Element),2)        
-        elif Edge == 'L3':
-            E0 = xraylib.EdgeEnergy(xraylib.SymbolToAtomicNumber(Element),3)  
-        else:
+        shell = EDGE_SHELLS.get(Edge)
+        if shell is None:
+            # Edge given directly as an energy [eV]
             E0 = float(Edge)/1000
+        else:
+            Z_edge = _sym2z(Element)
+            E0 = _edge_energy(Z_edge, shell)
 
 
 
 
-        if Elements['nElements']>1:
+        if nElements>1:
             # Determine Photabsorption Cross Sections for each element at E0 +/- 50 eV
-            Photo_XS = []
-            for x in range(0,Elements['nElements']):
-                if x == 0:
-                    Photo_XS = [xraylib.CS_Photo(Elements['Elements'][x], E0-delta), xraylib.CS_Photo(Elements['Elements'][x], E0+gamma)]
-                else:
-                    newPXS = [xraylib.CS_Photo(Elements['Elements'][x], E0-delta),xraylib.CS_Photo(Elements['Elements'][x], E0+gamma)]
-                    Photo_XS = np.vstack((Photo_XS,newPXS)) 
-
-            # Calcualte Mass Weighted Photo Absorption Cross Section:
-            mu_tot = []
-            for x in range(0,Elements['nElements']):
-                if x ==0:
-                    mu_tot = np.multiply(Photo_XS[x,:],Elements['massFractions'][x])
-                else:
-                    new_mu = np.multiply(Photo_XS[x,:],Elements['massFractions'][x])
-                    mu_tot = np.vstack((mu_tot, new_mu))
-                    
-            mu_ave = np.sum(mu_tot, axis = 0)
+            Photo_XS = _cs_photo_pair(Elements, E0-delta, E0+gamma)
 
             # Calculate Sample mass @ E0 + 50 eV and edge step
-
-            mass = Al*area/mu_ave[1]
+            mass, step, mu_ave_high = _mass_step(massFractions, Photo_XS[:,0], Photo_XS[:,1], Al, area)
             E0 = E0*1000
-
-            step = np.multiply(np.divide(np.multiply(Elements['massFractions'], mass), area), np.subtract(Photo_XS[:,1], Photo_XS[:,0]))
-            step = np.max(step)
             mass = mass*1000
     
-            return Error_Statement, E0, mass, step, mu_ave[1]
+            return Error_Statement, E0, mass, step, mu_ave_high
     
         else:
             # Determine Photabsorption Cross Sections for element at E0 +/- 50 eV
-            Photo_XS = [xraylib.CS_Photo(Elements['Elements'][0], E0-delta), xraylib.CS_Photo(Elements['Elements'][0], E0+gamma)]
+            Photo_XS = [xraylib.CS_Photo(int(Elements[0]), E0-delta), xraylib.CS_Photo(int(Elements[0]), E0+gamma)]
         
             # Calculate Sample mass @ E0 + 50 eV and edge step
 
@@ -208,7 +465,7 @@ def XASMassCalc(Sample, Element, Edge, Area, AL, gamma = 50 ,delta = 50):
             E0 = E0*1000
             mass = mass*1000
         
-            return Error_Statement, E0, mass, step, mu_ave[1]
+            return Error_Statement, E0, mass, step, Photo_XS[1]
         
 def XASPLOTTER(Sample, Element, Edge, Area, AL, gamma ,gamma2,delta = 50):
     from src import functions as fct
@@ -220,11 +477,15 @@ def XASPLOTTER(Sample, Element, Edge, Area, AL, gamma ,gamma2,delta = 50):
 
 
 
+@lru_cache(maxsize=128)
 def XASStoichCalc(Sample1, Sample2, Sample1_DR, Sample2_DR):
     '''
     Calculates the combined chemical formula for a sample and a diluement given
     a ratio of mass components.
 
+    Results are cached, so all arguments must be hashable (STR, INT or FLOAT);
+    passing e.g. a list or NumPy array raises TypeError.
+
     Parameters
     ----------
     Sample1 : STR
@@ -284,67 +545,42 @@ def XASStoichCalc(Sample1, Sample2, Sample1_DR, Sample2_DR):
             Sample2_dR = float(Sample2_DR)
             
             # Parse the compounds
-            Sample_Elements = xraylib.CompoundParser(Sample1)
+            Sample_Elements = _parse(Sample1)
 
-            Diluent_Elements = xraylib.CompoundParser(Sample2)
+            Diluent_Elements = _parse(Sample2)
         
         
             #Calculate New Nass Fractions
-            Updated_MF = []
-    
-            for x in range(0,Sample_Elements['nElements']):
-                if x == 0:
-                    Updated_MF = [Sample_Elements['Elements'][x], Sample_Elements['massFractions'][x]*Sample1_dR/(Sample1_dR + Sample2_dR)]
-                else:
-                    new_line = [Sample_Elements['Elements'][x], Sample_Elements['massFractions'][x]*Sample1_dR/(Sample1_dR + Sample2_dR)]    
-                    Updated_MF = np.vstack((Updated_MF,new_line))
-
+            Z1, MF1 = Sample_Elements[:2]
             if Sample2_dR > 0:
-                for x in range(0,Diluent_Elements['nElements']):
-                    new_line = [Diluent_Elements['Elements'][x], Diluent_Elements['massFractions'][x]*Sample2_dR/(Sample1_dR + Sample2_dR)]   
-                    Updated_MF = np.vstack((Updated_MF,new_line)) 
+                Z2, MF2 = Diluent_Elements[:2]
+            else:
+                Z2, MF2 = _NO_COMPONENT
+            Z3, MF3 = _NO_COMPONENT
 
             #Calcualte Moles of each component
-            mol = []
-            for x in range(0,np.shape(Updated_MF)[0]):
-                if x == 0:
-                    mol = Updated_MF[x,1]/xraylib.AtomicWeight(int(Updated_MF[x,0]))
-                else:
-                    new_mol = Updated_MF[x,1]/xraylib.AtomicWeight(int(Updated_MF[x,0]))
-                    mol = np.vstack((mol,new_mol))
-        
-            mol = mol/min(mol)
-
-            #Build New String
-            for x in range(0,np.shape(Updated_MF)[0]):
-                if x == 0:
-                    Sample_String = '{0:s}{1:0.6f}'.format(xraylib.AtomicNumberToSymbol(int(Updated_MF[x,0])), float(mol[x])) 
-                else:
-                    new_String = '{0:s}{1:0.6f}'.format(xraylib.AtomicNumberToSymbol(int(Updated_MF[x,0])), float(mol[x]))
-                    Sample_String = Sample_String+new_String
-
-
-
-            Diluted_Sample = xraylib.CompoundParser(Sample_String)
+            _check_atomic_weights(Z1, Z2, Z3)
+            Z, mol, mol_min = _compose_mass_fractions(Z1, MF1, Sample1_dR/(Sample1_dR + Sample2_dR),
+                                                      Z2, MF2, Sample2_dR/(Sample1_dR + Sample2_dR),
+                                                      Z3, MF3, 0.0, _AW_LUT)
+            _check_mol_min(mol_min)
 
             #Build Condensed String
-
-            for x in range(0,Diluted_Sample['nElements']):
-                if x == 0:
-                    Diluted_String = '{0:s}{1:0.6f}'.format(xraylib.AtomicNumberToSymbol(int(Diluted_Sample['Elements'][x])), float(Diluted_Sample['nAtoms'][x])) 
-                else:
-                    new_String = '{0:s}{1:0.6f}'.format(xraylib.AtomicNumberToSymbol(int(Diluted_Sample['Elements'][x])), float(Diluted_Sample['nAtoms'][x]))
-                    Diluted_String = Diluted_String+new_String
+            Diluted_String = _merge_formula(Z, mol)
         
             return Error_message, Diluted_String
 
 
 
+@lru_cache(maxsize=128)
 def metalCalculateSample(Metal_Site1, Metal1_Loading, Metal_Site2, Metal2_Loading, Support):
     '''
     Calculates the chemical formula of a material consiting of two metal site compositsions,
     weight loadings, and a support.
 
+    Results are cached, so all arguments must be hashable (STR, INT or FLOAT);
+    passing e.g. a list or NumPy array raises TypeError.
+
     Parameters
     ----------
     Metal_Site1 : STR
@@ -392,89 +628,48 @@ def metalCalculateSample(Metal_Site1, Metal1_Loading, Metal_Site2, Metal2_Loadin
         Metal_Loading1 = float(Metal1_Loading)
                
         # Parse metal Site 1 and Support 
-        MetalSite1_Elements = xraylib.CompoundParser(Metal_Site1)
+        MetalSite1_Elements = _parse(Metal_Site1)
         
-        Support_Elements = xraylib.CompoundParser(Support)
+        Support_Elements = _parse(Support)
     
    
         #Calculate New Nass Fractions
-        Updated_MF = []
+        Z1, MF1 = MetalSite1_Elements[:2]
+        Z3, MF3 = Support_Elements[:2]
     
+        #Metal site 2 is optional and contributes nothing when not defined
         if Metal_Site2 == '':
-            #Weight metal site 1 fractions and store them + atomic number
-            for x in range(0,MetalSite1_Elements['nElements']):
-                if x == 0:
-                    Updated_MF = [MetalSite1_Elements['Elements'][x], MetalSite1_Elements['massFractions'][x]*Metal_Loading1/100]
-                else:
-                    new_line = [MetalSite1_Elements['Elements'][x], MetalSite1_Elements['massFractions'][x]*Metal_Loading1/100]   
-                    Updated_MF = np.vstack((Updated_MF,new_line))
-                    
-            #Add Support Mass Fractions
-            for x in range(0,Support_Elements['nElements']):
-                new_line = [Support_Elements['Elements'][x], Support_Elements['massFractions'][x]*(1-(Metal_Loading1)/100)]   
-                Updated_MF = np.vstack((Updated_MF,new_line))
-        
+            Metal_Loading2 = 0.0
+            Z2, MF2 = _NO_COMPONENT
         else:
-            #Weight metal site 1 fractions and store them + atomic number      
-            for x in range(0,MetalSite1_Elements['nElements']):
-                if x == 0:
-                    Updated_MF = [MetalSite1_Elements['Elements'][x], MetalSite1_Elements['massFractions'][x]*Metal_Loading1/100]
-                else:
-                    new_line = [MetalSite1_Elements['Elements'][x], MetalSite1_Elements['massFractions'][x]*Metal_Loading1/100]   
-                    Updated_MF = np.vstack((Updated_MF,new_line))
-        
-            #Weight metal site 2 fractions and store them + atomic number      
-            MetalSite2_Elements = xraylib.CompoundParser(Metal_Site2)
             Metal_Loading2 = float(Metal2_Loading)
-            for x in range(0,MetalSite2_Elements['nElements']):
-                new_line = [MetalSite2_Elements['Elements'][x], MetalSite2_Elements['massFractions'][x]*Metal_Loading2/100]   
-                Updated_MF = np.vstack((Updated_MF,new_line))
-                
-            #Add Support Mass Fractions
-            for x in range(0,Support_Elements['nElements']):
-                new_line = [Support_Elements['Elements'][x], Support_Elements['massFractions'][x]*(1-(Metal_Loading1+Metal_Loading2)/100)]   
-                Updated_MF = np.vstack((Updated_MF,new_line))
+            Z2, MF2 = _parse(Metal_Site2)[:2]
     
+        total_Loading = (Metal_Loading1 + Metal_Loading2)/100
         
         #Calcualte Moles of each component
-        mol = []
-        for x in range(0,np.shape(Updated_MF)[0]):
-            if x == 0:
-                mol = Updated_MF[x,1]/xraylib.AtomicWeight(int(Updated_MF[x,0]))
-            else:
-                new_mol = Updated_MF[x,1]/xraylib.AtomicWeight(int(Updated_MF[x,0]))
-                mol = np.vstack((mol,new_mol))
-        
-        mol = mol/min(mol)
+        _check_atomic_weights(Z1, Z2, Z3)
+        Z, mol, mol_min = _compose_mass_fractions(Z1, MF1, Metal_Loading1/100,
+                                                  Z2, MF2, Metal_Loading2/100,
+                                                  Z3, MF3, 1-total_Loading, _AW_LUT)
+        _check_mol_min(mol_min)
 
        
-        #Build New String
-        for x in range(0,np.shape(Updated_MF)[0]):
-            if x == 0:
-                Sample_String = '{0:s}{1:0.6f}'.format(xraylib.AtomicNumberToSymbol(int(Updated_MF[x,0])), float(mol[x])) 
-            else:
-                new_String = '{0:s}{1:0.6f}'.format(xraylib.AtomicNumberToSymbol(int(Updated_MF[x,0])), float(mol[x]))
-                Sample_String = Sample_String+new_String
-
-        Constructed_Sample = xraylib.CompoundParser(Sample_String)
-
-        
         #Build Condensed String
-        for x in range(0,Constructed_Sample['nElements']):
-            if x == 0:
-                Sample_String = '{0:s}{1:0.6f}'.format(xraylib.AtomicNumberToSymbol(int(Constructed_Sample['Elements'][x])), float(Constructed_Sample['nAtoms'][x])) 
-            else:
-                new_String = '{0:s}{1:0.6f}'.format(xraylib.AtomicNumberToSymbol(int(Constructed_Sample['Elements'][x])), float(Constructed_Sample['nAtoms'][x]))
-                Sample_String = Sample_String+new_String
+        Sample_String = _merge_formula(Z, mol)
         
         return Sample_String
 
 
+@lru_cache(maxsize=128)
 def ComplexCalculateSample(Complex, Metal_Loading, Metal_Site, Support):
     '''
     Calculate the stoichiometry of a supported complex catalyst based upon the complex,
     its loading, or the metal center and its loading, and the support
 
+    Results are cached, so all arguments must be hashable (STR, INT or FLOAT);
+    passing e.g. a list or NumPy array raises TypeError.
+
     Parameters
     ----------
     Complex : STR
@@ -515,64 +710,34 @@ def ComplexCalculateSample(Complex, Metal_Loading, Metal_Site, Support):
         metal_Loading = float(Metal_Loading)
                
         # Parse metal Site 1 and Support 
-        MetalSite_Elements = xraylib.CompoundParser(Complex)
+        Z1, MF1, Complex_Index = _parse_complex(Complex)
         
-        Support_Elements = xraylib.CompoundParser(Support)
+        Support_Elements = _parse(Support)
     
    
         #Calculate New Nass Fractions
-        Updated_MF = []
+        Z2, MF2 = _NO_COMPONENT
+        Z3, MF3 = Support_Elements[:2]
         
         #Find Metal Site in Complex
-        ind = MetalSite_Elements['Elements'].index(xraylib.SymbolToAtomicNumber(Metal_Site))
-        wt_Factor = metal_Loading/MetalSite_Elements['massFractions'][ind]
-        
-        #Weight metal site 1 fractions and store them + atomic number      
-        for x in range(0,MetalSite_Elements['nElements']):
-            if x == 0:
-                Updated_MF = [MetalSite_Elements['Elements'][x], MetalSite_Elements['massFractions'][x]*wt_Factor/100]
-            else:
-                new_line = [MetalSite_Elements['Elements'][x], MetalSite_Elements['massFractions'][x]*wt_Factor/100]   
-                Updated_MF = np.vstack((Updated_MF,new_line))
-        
-        complex_MF = np.sum(Updated_MF[:,1])
+        ind = Complex_Index.get(_sym2z(Metal_Site))
+        if ind is None:
+            return ERROR3
+        wt_Factor = metal_Loading/MF1[ind]
         
-        #Add Support Mass Fractions
-        for x in range(0,Support_Elements['nElements']):
-            new_line = [Support_Elements['Elements'][x], Support_Elements['massFractions'][x]*(1-complex_MF)]   
-            Updated_MF = np.vstack((Updated_MF,new_line))
+        complex_MF = sum(MF1.tolist())*wt_Factor/100
     
         
         #Calcualte Moles of each component
-        mol = []
-        for x in range(0,np.shape(Updated_MF)[0]):
-            if x == 0:
-                mol = Updated_MF[x,1]/xraylib.AtomicWeight(int(Updated_MF[x,0]))
-            else:
-                new_mol = Updated_MF[x,1]/xraylib.AtomicWeight(int(Updated_MF[x,0]))
-                mol = np.vstack((mol,new_mol))
-        
-        mol = mol/min(mol)
+        _check_atomic_weights(Z1, Z2, Z3)
+        Z, mol, mol_min = _compose_mass_fractions(Z1, MF1, wt_Factor/100,
+                                                  Z2, MF2, 0.0,
+                                                  Z3, MF3, 1-complex_MF, _AW_LUT)
+        _check_mol_min(mol_min)
 
        
-        #Build New String
-        for x in range(0,np.shape(Updated_MF)[0]):
-            if x == 0:
-                Sample_String = '{0:s}{1:0.6f}'.format(xraylib.AtomicNumberToSymbol(int(Updated_MF[x,0])), float(mol[x])) 
-            else:
-                new_String = '{0:s}{1:0.6f}'.format(xraylib.AtomicNumberToSymbol(int(Updated_MF[x,0])), float(mol[x]))
-                Sample_String = Sample_String+new_String
-
-        Constructed_Sample = xraylib.CompoundParser(Sample_String)
-
-        
         #Build Condensed String
-        for x in range(0,Constructed_Sample['nElements']):
-            if x == 0:
-                Sample_String = '{0:s}{1:0.6f}'.format(xraylib.AtomicNumberToSymbol(int(Constructed_Sample['Elements'][x])), float(Constructed_Sample['nAtoms'][x])) 
-            else:
-                new_String = '{0:s}{1:0.6f}'.format(xraylib.AtomicNumberToSymbol(int(Constructed_Sample['Elements'][x])), float(Constructed_Sample['nAtoms'][x]))
-                Sample_String = Sample_String+new_String
+        Sample_String = _merge_formula(Z, mol)
         
         return Sample_String
     
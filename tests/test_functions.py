@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+
+"""Tests for `catmass.src.functions`."""
+
+
+import math
+import unittest
+from unittest import mock
+
+import numpy as np
+
+try:
+    import xraylib  # noqa: F401
+except ImportError:
+    xraylib = None
+
+
+@unittest.skipIf(xraylib is None, 'xraylib not installed')
+class TestXASMassCalc(unittest.TestCase):
+    """Tests for `XASMassCalc`."""
+
+    def setUp(self):
+        """Import the module under test."""
+        from catmass.src import functions
+        self.fct = functions
+
+    def variants(self):
+        """Yield with and without xraylib_np and the numba kernel."""
+        kernel = self.fct._mass_step
+        for xraylib_np in (self.fct.xraylib_np, None):
+            for compiled in (True, False):
+                func = kernel if compiled else getattr(kernel, 'py_func', kernel)
+                with self.subTest(xraylib_np=xraylib_np is not None, numba=compiled):
+                    with mock.patch.object(self.fct, 'xraylib_np', xraylib_np), \
+                            mock.patch.object(self.fct, '_mass_step', func):
+                        yield
+
+    def test_compound(self):
+        """Mass, edge step and cross section for a multi-element sample."""
+        for _ in self.variants():
+            result = self.fct.XASMassCalc('PtO2Al2O3', 'Pt', 'L3', '1', '2.5')
+            self.assertEqual(result[0], 'NONE')
+            self.assertAlmostEqual(result[1], 11563.8)
+            self.assertAlmostEqual(result[2], 21.710486, places=6)
+            self.assertAlmostEqual(result[3], 1.456574, places=6)
+            self.assertAlmostEqual(result[4], 115.151729, places=6)
+
+    def test_single_element(self):
+        """A pure element sample returns its own cross section."""
+        for _ in self.variants():
+            result = self.fct.XASMassCalc('Pt', 'Pt', 'L3', '1', '2.5')
+            self.assertEqual(result[0], 'NONE')
+            self.assertAlmostEqual(result[1], 11563.8)
+            self.assertAlmostEqual(result[2], 13.278692, places=6)
+            self.assertAlmostEqual(result[3], 1.502515, places=6)
+            self.assertAlmostEqual(result[4], 188.271558, places=6)
+
+    def test_edge_energy_below_range_raises(self):
+        """A typed edge energy too low for E0 - delta raises xraylib's error."""
+        for _ in self.variants():
+            with self.assertRaises(ValueError):
+                self.fct.XASMassCalc('PtO2', 'Pt', '50', '1', '2.5')
+
+    def test_zero_area_gives_nan_step(self):
+        """A zero sample area gives zero mass and a NaN edge step."""
+        for _ in self.variants():
+            with np.errstate(invalid='ignore', divide='ignore'):
+                result = self.fct.XASMassCalc('PtO2', 'Pt', 'L3', '0', '2.5')
+            self.assertEqual(result[2], 0.0)
+            self.assertTrue(math.isnan(result[3]))
+
+
+@unittest.skipIf(xraylib is None, 'xraylib not installed')
+class TestSampleFormulas(unittest.TestCase):
+    """Tests for the sample formula builders."""
+
+    def setUp(self):
+        """Import the module under test and clear the result caches."""
+        from catmass.src import functions
+        self.fct = functions
+        for func in (functions.XASStoichCalc, functions.metalCalculateSample,
+                     functions.ComplexCalculateSample):
+            func.cache_clear()
+
+    def variants(self):
+        """Yield once with the numba kernel and once with plain Python."""
+        kernel = self.fct._compose_mass_fractions
+        for compiled in (True, False):
+            with self.subTest(numba=compiled):
+                func = kernel if compiled else getattr(kernel, 'py_func', kernel)
+                with mock.patch.object(self.fct, '_compose_mass_fractions', func):
+                    yield
+                self.setUp()
+
+    def test_diluted_sample(self):
+        """Elements shared by sample and diluent are merged into one count."""
+        for _ in self.variants():
+            self.assertEqual(self.fct.XASStoichCalc('PtO2', 'Al2O3', '1', '5'),
+                             ('None', 'O35.415244Al22.276830Pt1.000000'))
+
+    def test_diluted_sample_single_element(self):
+        """A single element sample with no diluent weight is returned as is."""
+        for _ in self.variants():
+            self.assertEqual(self.fct.XASStoichCalc('Pt', 'Al2O3', '1', '0'),
+                             ('None', 'Pt1.000000'))
+
+    def test_metal_sample(self):
+        """One and two metal sites on a support."""
+        for _ in self.variants():
+            self.assertEqual(self.fct.metalCalculateSample('Pt', '1', '', '', 'Al2O3'),
+                             'O568.390524Al378.927016Pt1.000000')
+            self.assertEqual(self.fct.metalCalculateSample('Pt', '1', 'Pd', '2', 'Al2O3'),
+                             'O556.907887Al371.271925Pd3.667105Pt1.000000')
+
+    def test_complex_sample(self):
+        """A supported complex weighted by its metal center loading."""
+        for _ in self.variants():
+            self.assertEqual(self.fct.ComplexCalculateSample('PtCl2', '1', 'Pt', 'SiO2'),
+                             'O640.472292Si320.236146Cl2.000000Pt1.000000')
+
+    def test_complex_metal_center_substring(self):
+        """A metal symbol that only matches part of another symbol is not found."""
+        for _ in self.variants():
+            self.assertEqual(self.fct.ComplexCalculateSample('PtCl2', '1', 'P', 'SiO2'),
+                             'ERROR - Metal Center not in Complex')
+
+    def test_parsed_complex_is_read_only(self):
+        """The cached complex arrays and element index cannot be modified."""
+        Z, MF, Complex_Index = self.fct._parse_complex('PtCl2')
+        with self.assertRaises(TypeError):
+            Complex_Index[78] = 0
+        with self.assertRaises(ValueError):
+            MF[0] = 0.0
+
+    def test_repeated_call_is_cached(self):
+        """A repeated call with the same inputs is served from the cache."""
+        for func, args in ((self.fct.XASStoichCalc, ('PtO2', 'Al2O3', '1', '5')),
+                           (self.fct.metalCalculateSample, ('Pt', '1', '', '', 'Al2O3')),
+                           (self.fct.ComplexCalculateSample, ('PtCl2', '1', 'Pt', 'SiO2'))):
+            with self.subTest(func=func.__name__):
+                self.assertEqual(func(*args), func(*args))
+                self.assertEqual(func.cache_info().hits, 1)
+                self.assertEqual(func.cache_info().misses, 1)
+
+    def test_unhashable_argument_raises(self):
+        """Cached builders reject unhashable arguments with TypeError."""
+        with self.assertRaises(TypeError):
+            self.fct.metalCalculateSample('Pt', ['1'], '', '', 'Al2O3')
+
+    def test_zero_or_full_loading_raises(self):
+        """A 0, 100 or over 100 % loading leaves a component with no or negative moles."""
+        for _ in self.variants():
+            for loading in ('0', '100'):
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    with self.assertRaises(ValueError):
+                        self.fct.metalCalculateSample('Pt', loading, '', '', 'Al2O3')
+            with self.assertRaises(ValueError):
+                self.fct.metalCalculateSample('Pt', '60', 'Pd', '60', 'Al2O3')
+            with self.assertRaises(ValueError):
+                self.fct.ComplexCalculateSample('PtCl2', '90', 'Pt', 'SiO2')
+
+    def test_kernel_compiles_once(self):
+        """All builders share one compiled signature of the numba kernel."""
+        kernel = self.fct._compose_mass_fractions
+        if not hasattr(kernel, 'signatures'):
+            self.skipTest('numba not installed')
+        self.fct.XASStoichCalc('PtO2', 'Al2O3', '1', '5')
+        self.fct.XASStoichCalc('PtO2', 'Al2O3', '1', '0')
+        self.fct.metalCalculateSample('Pt', '1', '', '', 'Al2O3')
+        self.fct.metalCalculateSample('Pt', '1', 'Pd', '1', 'Al2O3')
+        self.fct.ComplexCalculateSample('PtCl2', '1', 'Pt', 'SiO2')
+        self.assertEqual(len(kernel.signatures), 1)
+
+    def test_element_without_atomic_weight_raises(self):
+        """Elements xraylib has no atomic weight for raise ValueError."""
+        with self.assertRaises(ValueError):
+            self.fct.metalCalculateSample('RfO2', '1', '', '', 'SiO2')